@@ -1,12 +1,20 @@
 import io
+import os
+import time
+import hashlib
+import tempfile
+from contextlib import suppress
+from pathlib import Path
 import yaml
 import numpy as np
 import pandas as pd
 import streamlit as st
 import gspread
+import xlsxwriter
+import pyarrow as pa
 from google.oauth2.service_account import Credentials
 
-from engine import compute_actions
+from engine import BOOL_COLS, COERCE_VERSION, EXPECTED_COLUMNS, NUM_COLS, coerce_frame, compute_actions
 
 st.set_page_config(page_title="Quality Screener", layout="wide")
 
@@ -21,20 +29,101 @@ SHEETS_SCOPES = [
     "https://www.googleapis.com/auth/drive",
 ]
 
+# df já convertido (coerce_frame) guardado em disco entre arranques da app
+CACHE_DIR = Path(".cache")
+# Idade máxima de um ficheiro, igual ao TTL de load_sheet: fórmulas (GOOGLEFINANCE,
+# IMPORTRANGE, NOW()) recalculam sem mudar a data de modificação da Drive
+CACHE_MAX_AGE = 300
+
+@st.cache_resource
 def get_gspread_client():
     info = dict(st.secrets["gcp_service_account"])
     creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPES)
     return gspread.authorize(creds)
 
-def sheet_to_df(gc, spreadsheet_id: str, worksheet_name: str):
+def _sha1(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+def _read_cache(cache_path):
+    if not cache_path.exists():
+        return None
+    try:
+        return pd.read_parquet(cache_path, engine="pyarrow")
+    except (OSError, ValueError, pa.ArrowException):
+        # Ficheiro truncado ou corrompido: conta como miss
+        with suppress(OSError):
+            cache_path.unlink(missing_ok=True)
+        return None
+
+def _write_cache(df, cache_path, sheet_hash):
+    # Escreve num temporário e troca com os.replace: o caminho final nunca fica a meio
+    tmp = None
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f"{sheet_hash}-", suffix=".tmp")
+        os.close(fd)
+        # Best effort: colunas de tipos mistos ou repetidas não são serializáveis em parquet
+        df.to_parquet(tmp, engine="pyarrow")
+        os.replace(tmp, cache_path)
+    except (OSError, ValueError, pa.ArrowException):
+        if tmp is not None:
+            with suppress(OSError):
+                os.unlink(tmp)
+    # Versões antigas da mesma sheet/worksheet já não voltam a ser lidas
+    with suppress(OSError):
+        for old in CACHE_DIR.glob(f"{sheet_hash}-*.parquet"):
+            if old != cache_path:
+                old.unlink(missing_ok=True)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_sheet(spreadsheet_id: str, worksheet_name: str):
+    gc = get_gspread_client()
     sh = gc.open_by_key(spreadsheet_id)
     ws = sh.worksheet(worksheet_name)
-    values = ws.get_all_values()
+
+    # A data de modificação (Drive API) invalida a cache quando há edições.
+    # Sem Drive API no projeto segue só com a Sheets API, sem cache em disco
+    try:
+        updated = sh.get_lastUpdateTime()
+    except gspread.exceptions.APIError:
+        updated = None
+
+    cache_path = None
+    if updated is not None:
+        sheet_hash = _sha1((spreadsheet_id, worksheet_name))
+        version = _sha1((COERCE_VERSION, ws.row_count, updated, int(time.time() // CACHE_MAX_AGE)))
+        cache_path = CACHE_DIR / f"{sheet_hash}-{version}.parquet"
+        cached = _read_cache(cache_path)
+        if cached is not None:
+            return cached
+
+    # Uma só chamada à API: ler o cabeçalho à parte custaria mais um round trip em série.
+    # UNFORMATTED_VALUE devolve números/booleanos nativos em vez de texto formatado
+    values = ws.get(
+        value_render_option=gspread.utils.ValueRenderOption.unformatted,
+        date_time_render_option=gspread.utils.DateTimeOption.formatted_string,
+        pad_values=True,
+    )
     if not values:
         return pd.DataFrame()
-    headers = values[0]
+    headers = [str(h) for h in values[0]]
     rows = values[1:]
-    return pd.DataFrame(rows, columns=headers)
+    df = pd.DataFrame(rows, columns=headers)
+
+    # Colunas depois da última que o motor usa não seguem para o cálculo nem para a UI
+    used = [i for i, h in enumerate(headers, start=1) if h.strip() in EXPECTED_COLUMNS]
+    if used:
+        df = df.iloc[:, :max(used)]
+
+    # Células vazias vêm como "": nas colunas que o motor converte passam a NaN, para
+    # chegarem já float. As outras ficam como vêm (um ticker 7203 não vira "7203.0").
+    # Por posição, porque a sheet pode repetir cabeçalhos (ex.: colunas em branco)
+    typed = np.array([c.strip() in NUM_COLS or c.strip() in BOOL_COLS for c in df.columns], dtype=bool)
+    df = coerce_frame(df.mask(df.eq("").to_numpy() & typed).infer_objects())
+
+    if cache_path is not None:
+        _write_cache(df, cache_path, sheet_hash)
+    return df
 
 # ----------------------------
 # Load profiles
@@ -97,8 +186,7 @@ if not spreadsheet_id:
     st.stop()
 
 try:
-    gc = get_gspread_client()
-    df = sheet_to_df(gc, spreadsheet_id, worksheet_name)
+    df = load_sheet(spreadsheet_id, worksheet_name)
 except Exception as e:
     st.error(f"Erro ao ligar ao Google Sheets: {e}")
     st.stop()
@@ -112,8 +200,12 @@ df.columns = [c.strip() for c in df.columns]
 # ----------------------------
 # Compute actions
 # ----------------------------
+@st.cache_data(show_spinner=False)
+def _cached_compute(df, cfg_tuple):
+    return compute_actions(df, dict(cfg_tuple))
+
 with st.spinner("A calcular decisões..."):
-    out = compute_actions(df, cfg)
+    out = _cached_compute(df, tuple(sorted(cfg.items())))
 
 st.success("Cálculo concluído.")
 
@@ -127,13 +219,23 @@ st.dataframe(out, use_container_width=True, height=500)
 # ----------------------------
 # Download Excel
 # ----------------------------
-buffer = io.BytesIO()
-with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-    out.to_excel(writer, index=False)
+@st.cache_data(show_spinner=False)
+def to_xlsx_bytes(df):
+    # constant_memory só guarda a linha corrente: escreve-se linha a linha
+    # (o to_excel do pandas escreve por colunas e perderia dados neste modo)
+    buffer = io.BytesIO()
+    wb = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    ws = wb.add_worksheet()
+    ws.write_row(0, 0, [str(c) for c in df.columns])
+    values = df.astype(object).where(df.notna(), None)
+    for i, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        ws.write_row(i, 0, row)
+    wb.close()
+    return buffer.getvalue()
 
 st.download_button(
     label="Download Excel",
-    data=buffer.getvalue(),
+    data=lambda: to_xlsx_bytes(out),
     file_name="screener_output.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
   )
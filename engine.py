@@ -1,5 +1,7 @@
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 EXPECTED_COLUMNS = [
     "ticker","name","sector","price",
@@ -22,97 +24,154 @@ NUM_COLS = [
     "interest_cover","score"
 ]
 
-def _to_bool(x):
-    if pd.isna(x):
-        return False
-    if isinstance(x, (bool, np.bool_)):
-        return bool(x)
-    s = str(x).strip().lower()
-    return s in {"true","1","yes","y","sim","s","ok"}
-
-def _to_num(x):
-    if pd.isna(x):
-        return np.nan
-    if isinstance(x, (int, float, np.integer, np.floating)):
-        return float(x)
-    s = str(x).strip().replace("%","").replace(",", ".")
-    try:
-        return float(s)
-    except Exception:
-        return np.nan
-
-def _normalize_drawdown(x):
-    """
-    Suporta:
-      -0.25 (fração)  -> -0.25
-      -25  (percent) -> -0.25
-    """
-    if pd.isna(x):
-        return np.nan
-    if x <= -1:
-        return x / 100.0
-    return x
-
-def _safe_get(r, col, default=None):
-    return r[col] if col in r.index else default
-
-def _passes_required(r, cfg):
+STR_COLS = ["ticker","name","sector","drawdown_trigger"]
+
+# Códigos de ACTION (índices em ACTION_LABELS)
+ACTION_HOLD, ACTION_WATCH, ACTION_BUY, ACTION_STRONG, ACTION_SPEC, ACTION_SELL = range(6)
+ACTION_LABELS = np.array(
+    ["HOLD", "WATCH", "BUY", "STRONG BUY", "SPECULATIVE / WATCH", "REVIEW SELL"], dtype=object
+)
+
+# Valores assumidos quando a coluna não vem na sheet
+_MISSING_DEFAULTS = {
+    "QUALITY_PASS": True,
+    "ENTRY_PERMITTED": False,
+    "BUY_CANDIDATE": False,
+    "score": np.nan,
+    "pass_debt": False,
+    "pass_interest_cover": False,
+    "pass_fcf": False,
+    "pass_roic": False,
+    "pass_payout": False,
+}
+
+TRUTHY = frozenset({"true","1","yes","y","sim","s","ok"})
+_TRUTHY_ARROW = pa.array(sorted(TRUTHY))
+_NUMBER_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+def _to_arrow_str(s):
+    # Células em falta ficam "nan": não é truthy nem número
+    return pa.array(s.astype(str), type=pa.string())
+
+def _vec_to_bool(s):
+    if pd.api.types.is_bool_dtype(s):
+        # "boolean" (nullable) pode trazer pd.NA: conta como False
+        return s.fillna(False).astype(bool)
+    if pd.api.types.is_numeric_dtype(s):
+        # Flags 1/0 sem texto (UNFORMATTED_VALUE; com vazios chegam como float)
+        return s.eq(1)
+    arr = pc.utf8_lower(pc.utf8_trim_whitespace(_to_arrow_str(s)))
+    return pd.Series(pc.is_in(arr, value_set=_TRUTHY_ARROW).to_numpy(zero_copy_only=False), index=s.index)
+
+def _vec_to_num(s):
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype(float)
+    arr = pc.replace_substring(_to_arrow_str(s), "%", "")
+    arr = pc.utf8_trim_whitespace(pc.replace_substring(arr, ",", "."))
+    # Texto que não é número passa a null (como errors="coerce")
+    arr = pc.if_else(pc.match_substring_regex(arr, _NUMBER_RE), arr, None)
+    return pd.Series(pc.cast(arr, pa.float64()).to_numpy(zero_copy_only=False), index=s.index)
+
+def _passes_required(cols, cfg):
     """
     Regras ligadas/desligadas via config:
       REQUIRE_PASS_DEBT, REQUIRE_PASS_INTEREST, REQUIRE_PASS_FCF, REQUIRE_PASS_ROIC, REQUIRE_PASS_PAYOUT
+    Devolve [(check, máscara de falha)] para as regras ligadas.
     """
     failed = []
 
     if cfg.get("REQUIRE_PASS_DEBT", True):
-        if not bool(_safe_get(r, "pass_debt", False)):
-            failed.append("pass_debt")
+        failed.append(("pass_debt", ~cols["pass_debt"]))
 
     if cfg.get("REQUIRE_PASS_INTEREST", True):
-        if not bool(_safe_get(r, "pass_interest_cover", False)):
-            failed.append("pass_interest_cover")
+        failed.append(("pass_interest_cover", ~cols["pass_interest_cover"]))
 
     if cfg.get("REQUIRE_PASS_FCF", True):
-        if not bool(_safe_get(r, "pass_fcf", False)):
-            failed.append("pass_fcf")
+        failed.append(("pass_fcf", ~cols["pass_fcf"]))
 
     if cfg.get("REQUIRE_PASS_ROIC", False):
-        if not bool(_safe_get(r, "pass_roic", False)):
-            failed.append("pass_roic")
+        failed.append(("pass_roic", ~cols["pass_roic"]))
 
     if cfg.get("REQUIRE_PASS_PAYOUT", False):
-        if not bool(_safe_get(r, "pass_payout", False)):
-            failed.append("pass_payout")
+        failed.append(("pass_payout", ~cols["pass_payout"]))
 
     return failed
 
+def _any_failed(checks, n):
+    if not checks:
+        return np.zeros(n, dtype=bool)
+    return np.logical_or.reduce([m for _, m in checks])
+
+def _join_failed(checks, n, sep):
+    # Cada combinação de falhas vira um código (bit por check); o texto é montado
+    # uma vez por combinação possível e distribuído por indexação
+    code = np.zeros(n, dtype=np.intp)
+    for bit, (_, m) in enumerate(checks):
+        code |= m.astype(np.intp) << bit
+    labels = np.array(
+        [sep.join(c for bit, (c, _) in enumerate(checks) if k >> bit & 1) for k in range(1 << len(checks))],
+        dtype=object,
+    )
+    return labels[code]
+
+# Colunas acrescentadas por compute_actions (substituem as homónimas da entrada)
+_DERIVED_COLS = ["dd_norm","ACTION","REASON_BUY","REASON_SELL","FAILED_CHECKS","BUY_SIGNAL","SELL_SIGNAL"]
+
+def _frame(columns, index):
+    # Por posição: colunas com o mesmo nome na sheet mantêm-se todas
+    out = pd.DataFrame(dict(enumerate(a for _, a in columns)), index=index, copy=False)
+    out.columns = [c for c, _ in columns]
+    return out
+
+def _scatter(values, idx, n, fill):
+    full = np.full(n, fill, dtype=object)
+    full[idx] = values
+    return full
+
+def _coerce_cols(df):
+    # Colunas tipadas, montadas num único DataFrame no fim (sem df.copy())
+    columns = []
+    for i, c in enumerate(df.columns):
+        c = c.strip()
+        s = df.iloc[:, i]
+        if c in STR_COLS:
+            # Normaliza tickers/strings
+            s = s.fillna("").astype(str).str.strip()
+        elif c in NUM_COLS:
+            s = _vec_to_num(s)
+        elif c in BOOL_COLS:
+            s = _vec_to_bool(s)
+        columns.append((c, s.to_numpy()))
+    return columns
+
+# Mudar quando o resultado de coerce_frame mudar (invalida caches guardadas em disco)
+COERCE_VERSION = 1
+
+def coerce_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Limpa nomes de colunas e converte texto/números/booleanos.
+    compute_actions volta a passar por aqui: colunas numéricas e booleanas já
+    convertidas seguem sem custo, as de texto voltam a levar strip.
+    """
+    return _frame(_coerce_cols(df), df.index)
+
 def compute_actions(df: pd.DataFrame, cfg: dict) -> pd.DataFrame:
     """
-    Entrada: df com as tuas colunas
+    Entrada: df com as tuas colunas (em bruto ou já passado por coerce_frame)
     Saída: df com ACTION, BUY_SIGNAL, SELL_SIGNAL, REASON_BUY, REASON_SELL, FAILED_CHECKS
     """
 
-    out = df.copy()
-    out.columns = [c.strip() for c in out.columns]
-
-    # Normaliza tickers/strings
-    for c in ["ticker","name","sector","drawdown_trigger"]:
-        if c in out.columns:
-            out[c] = out[c].astype(str).str.strip()
-
-    # Converte tipos
-    for c in NUM_COLS:
-        if c in out.columns:
-            out[c] = out[c].apply(_to_num)
-
-    for c in BOOL_COLS:
-        if c in out.columns:
-            out[c] = out[c].apply(_to_bool)
+    n = len(df)
+    columns = _coerce_cols(df)
+    cols = dict(columns)
 
     # Drawdown normalizado (fração negativa)
-    if "drawdown_from_52w_high" in out.columns:
-        out["dd_norm"] = out["drawdown_from_52w_high"].apply(_normalize_drawdown)
+    # Suporta -0.25 (fração) -> -0.25 e -25 (percent) -> -0.25
+    if "drawdown_from_52w_high" in cols:
+        dd = cols["drawdown_from_52w_high"].astype(float)
+        cols["dd_norm"] = np.where(dd <= -1, dd / 100.0, dd)
     else:
-        out["dd_norm"] = np.nan
+        cols["dd_norm"] = np.full(n, np.nan)
 
     # Thresholds
     SCORE_BUY_MIN = float(cfg.get("SCORE_BUY_MIN", 70))
@@ -120,78 +179,87 @@ def compute_actions(df: pd.DataFrame, cfg: dict) -> pd.DataFrame:
     DD_STRONG = float(cfg.get("DD_STRONG", -0.30))
     ALLOW_SPEC = bool(cfg.get("ALLOW_SPECULATIVE", True))
 
-    def sell_signal(r):
-        # Breaks estruturais
-        if not bool(_safe_get(r, "QUALITY_PASS", True)):
-            return True, "QUALITY_PASS=FALSE"
-        required_failed = _passes_required(r, cfg)
-        if required_failed:
-            return True, " / ".join(required_failed)
-        return False, ""
-
-    def buy_gate(r):
-        if not bool(_safe_get(r, "ENTRY_PERMITTED", False)):
-            return False, "ENTRY_PERMITTED=FALSE"
-        if not bool(_safe_get(r, "QUALITY_PASS", False)):
-            return False, "QUALITY_PASS=FALSE"
-
-        buy_candidate = bool(_safe_get(r, "BUY_CANDIDATE", False))
-        score = _safe_get(r, "score", np.nan)
-        score_ok = (pd.notna(score) and float(score) >= SCORE_BUY_MIN)
-
-        if not (buy_candidate or score_ok):
-            return False, "NO_BUY_CANDIDATE_OR_SCORE"
-
-        dd = _safe_get(r, "dd_norm", np.nan)
-        if pd.notna(dd) and float(dd) > DD_BUY:
-            return False, f"INSUFFICIENT_DRAWDOWN({float(dd):.0%})"
-
-        required_failed = _passes_required(r, cfg)
-        if required_failed:
-            if ALLOW_SPEC:
-                return True, "ENTRY_OK_WITH_FLAGS:" + ",".join(required_failed)
-            return False, "FAILED_REQUIRED:" + ",".join(required_failed)
-
-        return True, "ENTRY_OK"
-
-    def decide(r):
-        s, rs = sell_signal(r)
-        if s:
-            return "REVIEW SELL", "", rs, rs
-
-        b, rb = buy_gate(r)
-        if b:
-            dd = _safe_get(r, "dd_norm", np.nan)
-            flags = rb.replace("ENTRY_OK_WITH_FLAGS:", "") if rb.startswith("ENTRY_OK_WITH_FLAGS:") else ""
-            failed = flags.replace(",", " / ") if flags else ""
-
-            if pd.notna(dd) and float(dd) <= DD_STRONG and not failed:
-                return "STRONG BUY", rb, "", ""
-            if failed and ALLOW_SPEC:
-                return "SPECULATIVE / WATCH", rb, "", failed
-            return "BUY", rb, "", ""
-
-        watch_flags = []
-        if bool(_safe_get(r, "ENTRY_PERMITTED", False)):
-            for col in ["pass_debt","pass_interest_cover","pass_fcf","pass_payout","pass_roic"]:
-                if col in r.index and (bool(r[col]) is False):
-                    watch_flags.append(col)
-
-        if watch_flags:
-            return "WATCH", "", " / ".join(watch_flags), " / ".join(watch_flags)
-
-        return "HOLD", "", "", ""
-
-    decided = out.apply(decide, axis=1, result_type="expand")
-    decided.columns = ["ACTION","REASON_BUY","REASON_SELL","FAILED_CHECKS"]
-    out = pd.concat([out, decided], axis=1)
-
-    out["BUY_SIGNAL"] = out["ACTION"].isin(["BUY","STRONG BUY"])
-    out["SELL_SIGNAL"] = out["ACTION"].eq("REVIEW SELL")
-
-    if "score" in out.columns:
-        out = out.sort_values(by=["BUY_SIGNAL","SELL_SIGNAL","score"], ascending=[False, False, False])
-    else:
-        out = out.sort_values(by=["BUY_SIGNAL","SELL_SIGNAL"], ascending=[False, False])
-
-    return out
+    # Colunas do motor resolvidas uma vez (as que faltam não entram no output)
+    src = {c: cols[c] if c in cols else np.full(n, d) for c, d in _MISSING_DEFAULTS.items()}
+
+    qp = src["QUALITY_PASS"]
+    ep = src["ENTRY_PERMITTED"]
+    bc = src["BUY_CANDIDATE"]
+    score = src["score"]
+    dd = cols["dd_norm"]
+
+    required = _passes_required(src, cfg)
+    required_fail = _any_failed(required, n)
+
+    # Breaks estruturais
+    sell_mask = ~qp | required_fail
+
+    # Sem SELL e sem ENTRY_PERMITTED a linha fica sempre em HOLD:
+    # só as restantes passam pela tabela de decisão
+    idx = np.flatnonzero(ep | sell_mask)
+    m = len(idx)
+    qp, ep, bc, score, dd = qp[idx], ep[idx], bc[idx], score[idx], dd[idx]
+    required = [(c, f[idx]) for c, f in required]
+    required_fail, sell_mask = required_fail[idx], sell_mask[idx]
+
+    # Sem QUALITY_PASS na sheet não há entrada (mas também não há SELL)
+    qp_buy = qp & ("QUALITY_PASS" in cols)
+    score_ok = score >= SCORE_BUY_MIN
+    dd_ok = ~(dd > DD_BUY)  # drawdown em falta não bloqueia
+    buy_mask = ep & qp_buy & (bc | score_ok) & dd_ok & (~required_fail | ALLOW_SPEC)
+    strong_mask = buy_mask & (dd <= DD_STRONG) & ~required_fail
+    spec_mask = buy_mask & required_fail & ALLOW_SPEC
+
+    watch = [
+        (c, ~cols[c][idx])
+        for c in ["pass_debt","pass_interest_cover","pass_fcf","pass_payout","pass_roic"]
+        if c in cols
+    ]
+    watch_mask = ep & _any_failed(watch, m)
+
+    codes = np.zeros(n, dtype=np.int8)
+    codes[idx] = np.select(
+        [sell_mask, strong_mask, spec_mask, buy_mask, watch_mask],
+        [ACTION_SELL, ACTION_STRONG, ACTION_SPEC, ACTION_BUY, ACTION_WATCH],
+        default=ACTION_HOLD,
+    )
+
+    # Razões
+    required_reason = _join_failed(required, m, " / ")
+    sell_reason = np.where(~qp, "QUALITY_PASS=FALSE", required_reason)
+    buy_reason = np.where(required_fail, "ENTRY_OK_WITH_FLAGS:" + _join_failed(required, m, ","), "ENTRY_OK")
+    watch_reason = _join_failed(watch, m, " / ")
+
+    is_buy = ~sell_mask & buy_mask
+    is_spec = ~sell_mask & spec_mask
+    is_watch = ~sell_mask & ~buy_mask & watch_mask
+
+    cols["ACTION"] = ACTION_LABELS[codes]
+    cols["REASON_BUY"] = _scatter(np.where(is_buy, buy_reason, ""), idx, n, "")
+    cols["REASON_SELL"] = _scatter(
+        np.select([sell_mask, is_watch], [sell_reason, watch_reason], default=""), idx, n, ""
+    )
+    cols["FAILED_CHECKS"] = _scatter(
+        np.select(
+            [sell_mask, is_spec, is_watch],
+            [sell_reason, required_reason, watch_reason],
+            default="",
+        ),
+        idx, n, "",
+    )
+
+    cols["BUY_SIGNAL"] = (codes == ACTION_BUY) | (codes == ACTION_STRONG)
+    cols["SELL_SIGNAL"] = codes == ACTION_SELL
+
+    out = _frame(
+        [(c, a) for c, a in columns if c not in _DERIVED_COLS] + [(c, cols[c]) for c in _DERIVED_COLS],
+        df.index,
+    )
+
+    # BUY primeiro, depois SELL, depois score desc (NaN no fim); lexsort ordena pela última chave
+    keys = [~cols["SELL_SIGNAL"], ~cols["BUY_SIGNAL"]]
+    if "score" in cols:
+        keys.insert(0, np.nan_to_num(-cols["score"], nan=np.inf))
+    order = np.lexsort(keys)
+
+    return out.iloc[order]
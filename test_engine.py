@@ -0,0 +1,165 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+# ----------------------------
+# Referência: a tabela de decisão original, linha a linha
+# ----------------------------
+def _ref_bool(x):
+    if pd.isna(x):
+        return False
+    if isinstance(x, (bool, np.bool_)):
+        return bool(x)
+    return str(x).strip().lower() in {"true","1","yes","y","sim","s","ok"}
+
+def _ref_num(x):
+    if pd.isna(x):
+        return np.nan
+    if isinstance(x, (int, float, np.integer, np.floating)):
+        return float(x)
+    try:
+        return float(str(x).strip().replace("%","").replace(",", "."))
+    except Exception:
+        return np.nan
+
+def _ref_required(r, cfg):
+    rules = [
+        ("REQUIRE_PASS_DEBT", True, "pass_debt"),
+        ("REQUIRE_PASS_INTEREST", True, "pass_interest_cover"),
+        ("REQUIRE_PASS_FCF", True, "pass_fcf"),
+        ("REQUIRE_PASS_ROIC", False, "pass_roic"),
+        ("REQUIRE_PASS_PAYOUT", False, "pass_payout"),
+    ]
+    return [col for key, default, col in rules if cfg.get(key, default) and not bool(r.get(col, False))]
+
+def _ref_decide(r, cfg):
+    score_min = float(cfg.get("SCORE_BUY_MIN", 70))
+    dd_buy = float(cfg.get("DD_BUY", -0.20))
+    dd_strong = float(cfg.get("DD_STRONG", -0.30))
+    allow_spec = bool(cfg.get("ALLOW_SPECULATIVE", True))
+
+    if not bool(r.get("QUALITY_PASS", True)):
+        return "REVIEW SELL", "", "QUALITY_PASS=FALSE", "QUALITY_PASS=FALSE"
+    failed = _ref_required(r, cfg)
+    if failed:
+        return "REVIEW SELL", "", " / ".join(failed), " / ".join(failed)
+
+    score = r.get("score", np.nan)
+    dd = r["dd_norm"]
+    buy = (
+        bool(r.get("ENTRY_PERMITTED", False))
+        and bool(r.get("QUALITY_PASS", False))
+        and (bool(r.get("BUY_CANDIDATE", False)) or (pd.notna(score) and score >= score_min))
+        and not (pd.notna(dd) and dd > dd_buy)
+    )
+    if buy:
+        if pd.notna(dd) and dd <= dd_strong:
+            return "STRONG BUY", "ENTRY_OK", "", ""
+        return "BUY", "ENTRY_OK", "", ""
+
+    if bool(r.get("ENTRY_PERMITTED", False)):
+        watch = [c for c in ["pass_debt","pass_interest_cover","pass_fcf","pass_payout","pass_roic"] if c in r and not r[c]]
+        if watch:
+            return "WATCH", "", " / ".join(watch), " / ".join(watch)
+    return "HOLD", "", "", ""
+
+def reference_actions(df, cfg):
+    out = df.copy()
+    out.columns = [c.strip() for c in out.columns]
+    for c in ["ticker","name","sector","drawdown_trigger"]:
+        if c in out.columns:
+            out[c] = out[c].astype(str).str.strip()
+    for c in engine.NUM_COLS:
+        if c in out.columns:
+            out[c] = out[c].map(_ref_num).astype(float)
+    for c in engine.BOOL_COLS:
+        if c in out.columns:
+            out[c] = out[c].map(_ref_bool).astype(bool)
+    if "drawdown_from_52w_high" in out.columns:
+        dd = out["drawdown_from_52w_high"]
+        out["dd_norm"] = dd.where(~(dd <= -1), dd / 100.0)
+    else:
+        out["dd_norm"] = np.nan
+
+    rows = [dict(zip(out.columns, vals)) for vals in out.itertuples(index=False, name=None)]
+    decided = pd.DataFrame(
+        [_ref_decide(r, cfg) for r in rows],
+        columns=["ACTION","REASON_BUY","REASON_SELL","FAILED_CHECKS"],
+        index=out.index,
+    )
+    out = pd.concat([out, decided], axis=1)
+    out["BUY_SIGNAL"] = out["ACTION"].isin(["BUY","STRONG BUY"])
+    out["SELL_SIGNAL"] = out["ACTION"].eq("REVIEW SELL")
+    by = ["BUY_SIGNAL","SELL_SIGNAL"] + (["score"] if "score" in out.columns else [])
+    return out.sort_values(by=by, ascending=False, kind="stable")
+
+# ----------------------------
+# Dados: sheet em texto, como o get_all_values
+# ----------------------------
+BOOL_VALUES = ["TRUE","FALSE","1","0","yes","Sim"," ok ","n",""]
+NUM_VALUES = ["12,5","-25%","-0.3","-0.15"," 71 ","80","65","90","-40","abc",""]
+
+def make_sheet(n=300, seed=0, drop=()):
+    rng = np.random.default_rng(seed)
+    data = {
+        " ticker ": [f" T{i} " for i in range(n)],
+        "name": rng.choice(["Foo ", " Bar", "Baz"], n),
+        "notes": rng.choice(["a", "b"], n),
+    }
+    for c in engine.NUM_COLS:
+        data[c] = rng.choice(NUM_VALUES, n)
+    for c in engine.BOOL_COLS:
+        data[c] = rng.choice(BOOL_VALUES, n)
+    df = pd.DataFrame({k: np.asarray(v, dtype=object) for k, v in data.items()})
+    df = df.drop(columns=list(drop))
+    # coluna repetida (ex.: duas colunas de notas na sheet)
+    return pd.concat([df, df[["notes"]]], axis=1)
+
+CFGS = [
+    dict(zip(["REQUIRE_PASS_DEBT","REQUIRE_PASS_INTEREST","REQUIRE_PASS_FCF","REQUIRE_PASS_ROIC","REQUIRE_PASS_PAYOUT","ALLOW_SPECULATIVE"], bits))
+    for bits in itertools.product([True, False], repeat=6)
+][::7]
+
+DROPS = [(), ("QUALITY_PASS",), ("pass_debt","pass_roic"), ("score",), ("drawdown_from_52w_high",), ("ENTRY_PERMITTED",)]
+
+def assert_same(got, want):
+    assert list(got.columns) == list(want.columns)
+    assert list(got.index) == list(want.index)
+    for i, c in enumerate(want.columns):
+        g, w = got.iloc[:, i].to_numpy(), want.iloc[:, i].to_numpy()
+        if c in engine.NUM_COLS or c == "dd_norm":
+            np.testing.assert_allclose(g.astype(float), w.astype(float), equal_nan=True, err_msg=c)
+        else:
+            assert [str(x) for x in g] == [str(x) for x in w], c
+
+@pytest.mark.parametrize("drop", DROPS)
+@pytest.mark.parametrize("cfg", CFGS)
+def test_matches_reference_decision_table(cfg, drop):
+    df = make_sheet(drop=drop)
+    cfg = dict(cfg, SCORE_BUY_MIN=70, DD_BUY=-0.20, DD_STRONG=-0.30)
+    assert_same(engine.compute_actions(df, cfg), reference_actions(df, cfg))
+
+def test_nullable_boolean_na_is_false():
+    df = make_sheet(n=50, seed=1)
+    for c in engine.BOOL_COLS:
+        df[c] = pd.array(np.where(np.arange(50) % 3 == 0, None, np.arange(50) % 2 == 0), dtype="boolean")
+    assert_same(engine.compute_actions(df, {}), reference_actions(df, {}))
+
+def test_empty_sheet():
+    out = engine.compute_actions(make_sheet(n=0), {})
+    assert out.empty
+    assert {"ACTION","REASON_BUY","REASON_SELL","FAILED_CHECKS","BUY_SIGNAL","SELL_SIGNAL"} <= set(out.columns)
+
+def test_coerced_frame_gives_same_actions():
+    df = make_sheet(seed=2)
+    assert_same(engine.compute_actions(engine.coerce_frame(df), {}), engine.compute_actions(df, {}))
+
+def test_coerced_frame_survives_parquet(tmp_path):
+    df = make_sheet(seed=3).iloc[:, :-1]  # parquet não aceita colunas repetidas
+    path = tmp_path / "sheet.parquet"
+    engine.coerce_frame(df).to_parquet(path, engine="pyarrow")
+    assert_same(engine.compute_actions(pd.read_parquet(path, engine="pyarrow"), {}), reference_actions(df, {}))